@@ -1,6 +1,6 @@
 """Configuration management for Moonraker to Firebase sync."""
+import functools
 import os
-from pathlib import Path
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -38,19 +38,34 @@ class Config:
     
     # Sync Configuration
     SYNC_INTERVAL = int(os.getenv("SYNC_INTERVAL", "15"))  # Sync interval in seconds
+    SYNC_MIN_INTERVAL = float(os.getenv("SYNC_MIN_INTERVAL", "1.0"))  # Minimum seconds between Firestore writes
+    # "periodic": every SYNC_INTERVAL; "hybrid": also right away on print state changes;
+    # "immediate": on every status update (still limited by SYNC_MIN_INTERVAL)
+    SYNC_MODE = os.getenv("SYNC_MODE", "hybrid").lower()
+    SYNC_MODES = ("periodic", "hybrid", "immediate")
     
     @classmethod
+    @functools.lru_cache(maxsize=1)
     def validate(cls):
-        """Validate that required configuration is present."""
+        """
+        Validate that required configuration is present.
+
+        Settings are read once at import, so a successful result is cached
+        and repeated calls are free. Failures raise and are not cached.
+        """
         errors = []
         
         if not cls.FIREBASE_PROJECT_ID:
             errors.append("FIREBASE_PROJECT_ID is required")
         
-        service_account_path = Path(cls.FIREBASE_SERVICE_ACCOUNT_KEY)
-        if not service_account_path.exists():
+        if not os.path.isfile(cls.FIREBASE_SERVICE_ACCOUNT_KEY):
+            errors.append(
+                f"Firebase service account key not found: {cls.FIREBASE_SERVICE_ACCOUNT_KEY}"
+            )
+        
+        if cls.SYNC_MODE not in cls.SYNC_MODES:
             errors.append(
-                f"Firebase service account key not found: {service_account_path}"
+                f"SYNC_MODE must be one of {', '.join(cls.SYNC_MODES)} (got {cls.SYNC_MODE!r})"
             )
         
         if errors:
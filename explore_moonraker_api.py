@@ -1,17 +1,50 @@
 """Temporary script to explore Moonraker API endpoints and available data."""
 import requests
+from requests.adapters import HTTPAdapter
 import json
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 from typing import Dict, Any, List
 import sys
 
 BASE_URL = "http://printer.local"
 
+# Shared session so requests reuse keep-alive connections; the pool is
+# sized to match the fetch_all worker count
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=8))
+SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=8))
+
+# Printer objects fetched in a single query and shared by the
+# printer info, temperature and print status sections
+STATUS_OBJECTS = MappingProxyType({
+    "heater_bed": None,
+    "extruder": None,
+    "temperature_sensor bed": None,
+    "temperature_sensor extruder": None,
+    "print_stats": None,
+    "display_status": None,
+    "gcode_move": None,
+    "virtual_sdcard": None
+})
+
+# Independent requests made by the explore_* sections, keyed by name
+ENDPOINTS = MappingProxyType({
+    "server_info": ("GET", "/server/info", None),
+    "server_config": ("GET", "/server/config", None),
+    "temperature_store": ("GET", "/server/temperature_store", None),
+    "printer_info": ("GET", "/printer/info", None),
+    "objects_list": ("GET", "/printer/objects/list", None),
+    "status": ("GET", "/printer/objects/query", STATUS_OBJECTS),
+    "job_queue": ("GET", "/server/job_queue/status", None),
+    "history": ("GET", "/server/history/list", MappingProxyType({"limit": 5})),
+})
+
 
 def print_section(title: str):
-    """Print a formatted section header."""
-    print("\n" + "=" * 80)
-    print(f"  {title}")
-    print("=" * 80)
+    """Print a formatted section header, flushing the previous section."""
+    sys.stdout.flush()
+    print(f"\n{'=' * 80}\n  {title}\n{'=' * 80}")
 
 
 def print_json(data: Any, indent: int = 2):
@@ -36,9 +69,9 @@ def test_endpoint(method: str, endpoint: str, params: Dict[str, Any] = None, dat
     
     try:
         if method.upper() == "GET":
-            response = requests.get(url, params=params, timeout=5)
+            response = SESSION.get(url, params=params, timeout=5)
         elif method.upper() == "POST":
-            response = requests.post(url, json=data, params=params, timeout=5)
+            response = SESSION.post(url, json=data, params=params, timeout=5)
         else:
             raise ValueError(f"Unsupported method: {method}")
         
@@ -60,102 +93,103 @@ def test_endpoint(method: str, endpoint: str, params: Dict[str, Any] = None, dat
         return None
 
 
-def explore_server_info():
+def fetch_all(max_workers: int = 8) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetch all ENDPOINTS concurrently.
+    
+    Args:
+        max_workers: Maximum number of requests in flight
+        
+    Returns:
+        Response data keyed by endpoint name (None for failed requests)
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(lambda request: test_endpoint(*request), ENDPOINTS.values())
+        return dict(zip(ENDPOINTS, results))
+
+
+def explore_server_info(results: Dict[str, Dict[str, Any]]):
     """Explore server information endpoints."""
     print_section("Server Information")
     
     # Server info
     print("\n📡 Server Info:")
-    result = test_endpoint("GET", "/server/info")
+    result = results["server_info"]
     if result:
         print_json(result.get("result", {}))
     
     # Server config
     print("\n⚙️  Server Config:")
-    result = test_endpoint("GET", "/server/config")
+    result = results["server_config"]
     if result:
         print_json(result.get("result", {}))
     
     # Server temperature store
     print("\n🌡️  Temperature Store:")
-    result = test_endpoint("GET", "/server/temperature_store")
+    result = results["temperature_store"]
     if result:
         print_json(result.get("result", {}))
 
 
-def explore_printer_info():
+def explore_printer_info(results: Dict[str, Dict[str, Any]]):
     """Explore printer information endpoints."""
     print_section("Printer Information")
     
     # Printer info
     print("\n🖨️  Printer Info:")
-    result = test_endpoint("GET", "/printer/info")
+    result = results["printer_info"]
     if result:
         print_json(result.get("result", {}))
     
     # Printer objects list
     print("\n📋 Available Printer Objects:")
-    result = test_endpoint("GET", "/printer/objects/list")
+    result = results["objects_list"]
     if result:
         objects = result.get("result", {}).get("objects", [])
         print(f"Found {len(objects)} objects:")
-        for obj in objects[:20]:  # Show first 20
-            print(f"  - {obj}")
+        if objects:
+            print("\n".join(f"  - {obj}" for obj in objects[:20]))  # Show first 20
         if len(objects) > 20:
             print(f"  ... and {len(objects) - 20} more")
     
     # Printer objects query (get current status)
     print("\n📊 Current Printer Status (printer.objects.query):")
-    result = test_endpoint("GET", "/printer/objects/query", params={
-        "heater_bed": None,
-        "extruder": None,
-        "temperature_sensor bed": None,
-        "temperature_sensor extruder": None,
-        "print_stats": None,
-        "display_status": None,
-        "gcode_move": None,
-        "virtual_sdcard": None
-    })
+    result = results["status"]
     if result:
         print_json(result.get("result", {}).get("status", {}))
 
 
-def explore_print_status():
+def explore_print_status(results: Dict[str, Dict[str, Any]]):
     """Explore print status and job information."""
     print_section("Print Status & Jobs")
     
     # Print status
     print("\n🖨️  Print Status:")
-    result = test_endpoint("GET", "/printer/objects/query", params={"print_stats": None})
+    result = results["status"]
     if result:
         print_stats = result.get("result", {}).get("status", {}).get("print_stats", {})
         print_json(print_stats)
     
     # Job queue status
     print("\n📋 Job Queue Status:")
-    result = test_endpoint("GET", "/server/job_queue/status")
+    result = results["job_queue"]
     if result:
         print_json(result.get("result", {}))
     
     # History
     print("\n📜 Print History:")
-    result = test_endpoint("GET", "/server/history/list", params={"limit": 5})
+    result = results["history"]
     if result:
         print_json(result.get("result", {}))
 
 
-def explore_temperature_data():
+def explore_temperature_data(results: Dict[str, Dict[str, Any]]):
     """Explore temperature-related data."""
     print_section("Temperature Data")
     
-    # Query all temperature-related objects
+    # Temperature-related objects from the shared status query
     print("\n🌡️  Temperature Sensors & Heaters:")
-    result = test_endpoint("GET", "/printer/objects/query", params={
-        "heater_bed": None,
-        "extruder": None,
-        "temperature_sensor bed": None,
-        "temperature_sensor extruder": None
-    })
+    result = results["status"]
     if result:
         status = result.get("result", {}).get("status", {})
         
@@ -191,14 +225,19 @@ def explore_websocket_info():
     print("   - server.config")
     print("\n💡 Notification Methods:")
     print("   - notify_status_update (sent when subscribed objects change)")
+    print("\n🔁 Polling vs. Subscribing:")
+    print("   The HTTP queries above are one-shot snapshots. main.py does not poll;")
+    print("   moonraker_client.py uses printer.objects.subscribe, and Moonraker then")
+    print("   pushes only the fields that changed. firebase_sync.py merges those")
+    print("   deltas into the full status before syncing.")
 
 
-def explore_all_objects():
+def explore_all_objects(results: Dict[str, Dict[str, Any]]):
     """Query all available printer objects to see their structure."""
     print_section("All Available Printer Objects (Sample Data)")
     
-    # First get the list
-    result = test_endpoint("GET", "/printer/objects/list")
+    # Reuse the object list fetched up front
+    result = results["objects_list"]
     if not result:
         return
     
@@ -225,15 +264,25 @@ def explore_all_objects():
         print(f"\n... and {len(objects) - 10} more objects available")
 
 
+# Sections printed from the prefetched results, in display order
+SECTIONS = (
+    explore_server_info,
+    explore_printer_info,
+    explore_temperature_data,
+    explore_print_status,
+)
+
+
 def main():
     """Main exploration function."""
-    print("\n" + "=" * 80)
-    print("  Moonraker API Explorer")
-    print("  Exploring: " + BASE_URL)
-    print("=" * 80)
+    # Buffer output and flush once per section instead of once per line
+    if hasattr(sys.stdout, "reconfigure"):
+        sys.stdout.reconfigure(line_buffering=False)
+    
+    print(f"\n{'=' * 80}\n  Moonraker API Explorer\n  Exploring: {BASE_URL}\n{'=' * 80}")
     
     # Test basic connectivity
-    print("\n🔍 Testing connectivity...")
+    print("\n🔍 Testing connectivity...", flush=True)
     result = test_endpoint("GET", "/server/info")
     if not result:
         print("\n❌ Cannot connect to Moonraker. Please check:")
@@ -244,18 +293,19 @@ def main():
     
     print("✅ Connected successfully!\n")
     
+    # Fetch every endpoint concurrently, then print each section in order
+    results = fetch_all()
+    
     # Explore different aspects
-    explore_server_info()
-    explore_printer_info()
-    explore_temperature_data()
-    explore_print_status()
+    for explore in SECTIONS:
+        explore(results)
     explore_websocket_info()
     
     # Ask if user wants to see all objects
     print("\n" + "=" * 80)
     response = input("\nDo you want to see data from all available printer objects? (y/n): ")
     if response.lower() == 'y':
-        explore_all_objects()
+        explore_all_objects(results)
     
     print("\n" + "=" * 80)
     print("  Exploration Complete!")
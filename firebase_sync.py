@@ -1,49 +1,246 @@
 """Firebase Firestore integration for syncing printer status."""
 import logging
-from datetime import datetime, timezone
-from typing import Dict, Any, Optional, Union, List
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Dict, Any, Iterator, Optional, Set, Tuple, Union, List
 import threading
 import requests
-import firebase_admin
-from firebase_admin import credentials, firestore
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from config import Config
 
+if TYPE_CHECKING:
+    # firebase_admin pulls in grpc and google-cloud; it is imported lazily in initialize()
+    from firebase_admin import firestore
+
 logger = logging.getLogger(__name__)
 
 
-def round_value(value: Union[float, int], decimals: int = 2) -> Union[float, int]:
+def _make_rounder(decimals: int) -> Callable[[Optional[Union[float, int]]], Optional[Union[float, int]]]:
     """
-    Round a numeric value to specified decimal places.
+    Build a rounding function for a fixed number of decimal places.
+    
+    Moonraker values are already JSON numbers, so no type checks or
+    coercion are done. Whole numbers are returned as ints.
     
     Args:
-        value: The value to round
-        decimals: Number of decimal places (default: 2)
+        decimals: Number of decimal places
         
     Returns:
-        Rounded value (returns int if decimals=0 and value is whole number)
+        A function rounding a number, passing None through
     """
-    if value is None:
-        return None
-    if isinstance(value, int):
-        return value
-    rounded = round(float(value), decimals)
-    # Return as int if it's a whole number
-    if decimals == 0 or rounded == int(rounded):
-        return int(rounded)
-    return rounded
+    if decimals == 0:
+        def rounder(value):
+            return None if value is None else int(round(value))
+    else:
+        def rounder(value):
+            if value is None:
+                return None
+            rounded = round(value, decimals)
+            # Return as int if it's a whole number
+            whole = int(rounded)
+            return whole if whole == rounded else rounded
+    return rounder
+
+
+# Per-attempt timeout and overall retry deadline for status writes (seconds).
+# Kept short so a Firestore hiccup can't stall the sync thread past the next tick.
+_WRITE_TIMEOUT = 5.0
+_WRITE_RETRY_DEADLINE = 10.0
+
+# Queued Moonraker frames that force an early fold if syncing falls behind
+_MAX_PENDING_UPDATES = 256
+
+# Maximum WhatsApp notifications sent concurrently
+_NOTIFY_WORKERS = 8
+
+# WhatsApp API (connect, read) timeouts in seconds. After _BREAKER_THRESHOLD
+# consecutive failures, calls are skipped for _BREAKER_COOLDOWN seconds.
+_WHATSAPP_TIMEOUT = (1.5, 4.0)
+_BREAKER_THRESHOLD = 5
+_BREAKER_COOLDOWN = 30.0
+
+# How long (seconds) and how many user profiles are cached for notifications
+_USER_CACHE_TTL = 300.0
+_USER_CACHE_MAX = 1024
+
+# Log every Nth successful status write at INFO (the rest at DEBUG)
+_SYNC_LOG_EVERY = 20
+
+# Sentinel for distinguishing a missing key from an explicit None
+_MISSING = object()
+
+# Printer objects read by transform_status_data; changes to anything else
+# (e.g. gcode_move position) are merged but don't trigger a sync
+_SYNCED_OBJECTS = frozenset((
+    "heater_bed",
+    "extruder",
+    "heaters",
+    "print_stats",
+    "virtual_sdcard",
+    "display_status",
+))
+
+# Rounding applied to each synced numeric field, specialized once at import
+_FIELD_ROUNDERS = {
+    "target": _make_rounder(0),  # Whole numbers for targets
+    "temperature": _make_rounder(1),  # 1 decimal for temps
+    "print_duration": _make_rounder(1),
+    "time_remaining": _make_rounder(0),
+    "progress": _make_rounder(2),  # 2 decimals for progress
+    "file_size": _make_rounder(0),
+}
+
+# Heater fields to sync, paired with their rounder
+_HEATER_FIELDS = tuple((field, _FIELD_ROUNDERS[field]) for field in ("target", "temperature"))
+
+
+def _extract_heater(heater: Any) -> Dict[str, Any]:
+    """
+    Extract the synced fields from a Moonraker heater object.
+    
+    Args:
+        heater: Heater object from Moonraker, or None if not reported
+        
+    Returns:
+        Rounded heater fields, only including values that are present
+    """
+    if not heater:
+        return {}
+    return {
+        field: rounder(value)
+        for field, rounder in _HEATER_FIELDS
+        if (value := heater.get(field)) is not None
+    }
+
+
+def _flatten(data: Dict[str, Any], prefix: str = "") -> Iterator[Tuple[str, Any]]:
+    """
+    Flatten nested dicts into Firestore dotted field paths.
+    
+    Args:
+        data: The (possibly nested) document data
+        prefix: Path of the enclosing map, including the trailing dot
+        
+    Yields:
+        (field_path, value) pairs for every non-dict leaf
+    """
+    for key, value in data.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", value
+
+
+@lru_cache(maxsize=1)
+def _get_db() -> "firestore.Client":
+    """
+    Initialize the Firebase Admin SDK and create the Firestore client.
+    
+    Cached, so the service account key is parsed and the client created
+    only once per process, however many FirebaseSync instances exist.
+    
+    Returns:
+        The shared Firestore client
+    """
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    
+    # Check if Firebase app already exists
+    try:
+        firebase_admin.get_app()
+        logger.info("Firebase app already initialized")
+    except ValueError:
+        # Initialize Firebase Admin SDK
+        cred_path = Config.FIREBASE_SERVICE_ACCOUNT_KEY
+        cred = credentials.Certificate(cred_path)
+        
+        firebase_admin.initialize_app(cred, {
+            'projectId': Config.FIREBASE_PROJECT_ID,
+        })
+        logger.info("Firebase Admin SDK initialized")
+    
+    return firestore.client()
 
 
 class FirebaseSync:
     """Handles syncing printer status to Firebase Firestore."""
     
+    # Fixed attribute set: smaller instances and faster attribute access on the sync path
+    __slots__ = (
+        "db",
+        "_doc_ref",
+        "_server_timestamp",
+        "_write_retry",
+        "_not_found",
+        "_transactional",
+        "_initialized",
+        "_latest_status",
+        "_pending_updates",
+        "_status_lock",
+        "_status_dirty",
+        "_last_synced_data",
+        "_last_print_state",
+        "_last_sync_time",
+        "_sync_count",
+        "_min_sync_interval",
+        "_whatsapp_api_url",
+        "_current_file_metadata",
+        "_queue_listener",
+        "_notify_pool",
+        "_notify_inflight",
+        "_notify_lock",
+        "_http",
+        "_wa_failures",
+        "_wa_open_until",
+        "_user_cache",
+        "_user_cache_lock",
+        "_extruder_key",
+    )
+    
     def __init__(self):
         """Initialize Firebase Admin SDK."""
         self.db: Optional[firestore.Client] = None
+        self._doc_ref: Optional[firestore.DocumentReference] = None  # Status document, resolved once
+        self._server_timestamp = None  # firestore.SERVER_TIMESTAMP, bound in initialize()
+        self._write_retry = None  # Retry policy for status writes, built in initialize()
+        self._not_found = None  # NotFound exception type, imported in initialize()
+        self._transactional = None  # firestore.transactional decorator, bound in initialize()
         self._initialized = False
         self._latest_status: Dict[str, Any] = {}  # Store latest merged status data
-        self._last_synced_data: Dict[str, Any] = {}  # Store last data synced to Firestore
+        self._pending_updates: deque = deque()  # Raw Moonraker frames not yet merged
+        self._status_lock = threading.Lock()  # Guards _latest_status; syncs run on a worker thread
+        self._status_dirty = False  # True when status or metadata changed since the last transform
+        self._last_synced_data: Dict[str, Any] = {}  # Last values written to Firestore, by dotted field path
+        self._last_print_state: Optional[str] = None  # Last print_stats.state seen from Moonraker
+        self._last_sync_time = 0.0  # Monotonic time of the last Firestore write
+        self._sync_count = 0  # Number of successful status writes
+        # Config values read on every sync/notification, snapshotted once
+        self._min_sync_interval = Config.SYNC_MIN_INTERVAL
+        self._whatsapp_api_url = Config.WHATSAPP_API_URL
         self._current_file_metadata: Dict[str, Any] = {}  # Store metadata for current file
         self._queue_listener = None
+        # Notifications are slow network calls; send them in parallel (threads start lazily)
+        self._notify_pool = ThreadPoolExecutor(max_workers=_NOTIFY_WORKERS, thread_name_prefix="notify")
+        self._notify_inflight: Set[Tuple[str, str]] = set()  # (queue document id, user_id) with a notification in flight
+        self._notify_lock = threading.Lock()
+        # Keep-alive session for the WhatsApp API. Only failures to connect are
+        # retried: the request never reached the server, so it can't be sent twice
+        self._http = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=2, connect=2, read=0)
+        )
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+        self._wa_failures = 0  # Consecutive WhatsApp API failures (guarded by _notify_lock)
+        self._wa_open_until = 0.0  # Monotonic time until which WhatsApp calls are skipped
+        self._user_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}  # user_id -> (fetched_at, user data)
+        self._user_cache_lock = threading.Lock()  # Notifications run on several threads
+        self._extruder_key: Optional[str] = None  # Last extruder name found in the heaters object
     
     def initialize(self):
         """Initialize Firebase Admin SDK."""
@@ -51,22 +248,19 @@ class FirebaseSync:
             return
         
         try:
-            # Check if Firebase app already exists
-            try:
-                firebase_admin.get_app()
-                logger.info("Firebase app already initialized")
-            except ValueError:
-                # Initialize Firebase Admin SDK
-                cred_path = Config.FIREBASE_SERVICE_ACCOUNT_KEY
-                cred = credentials.Certificate(cred_path)
-                
-                firebase_admin.initialize_app(cred, {
-                    'projectId': Config.FIREBASE_PROJECT_ID,
-                })
-                logger.info("Firebase Admin SDK initialized")
+            from firebase_admin import firestore
+            from google.api_core import exceptions, retry
             
-            # Get Firestore client
-            self.db = firestore.client()
+            # Get the shared Firestore client
+            self.db = _get_db()
+            self._doc_ref = self.db.collection(Config.FIRESTORE_COLLECTION).document("current")
+            self._server_timestamp = firestore.SERVER_TIMESTAMP
+            # Retry transient errors with a short backoff instead of the SDK's long default
+            self._write_retry = retry.Retry(
+                initial=0.2, maximum=2.0, multiplier=2.0, deadline=_WRITE_RETRY_DEADLINE
+            )
+            self._not_found = exceptions.NotFound
+            self._transactional = firestore.transactional
             self._initialized = True
             logger.info("Firestore client initialized")
             
@@ -76,7 +270,6 @@ class FirebaseSync:
         except Exception as e:
             logger.error(f"Failed to initialize Firebase: {e}")
             raise
-            raise
     
     def update_metadata(self, metadata: Dict[str, Any]):
         """
@@ -85,7 +278,10 @@ class FirebaseSync:
         Args:
             metadata: File metadata from Moonraker
         """
-        self._current_file_metadata = metadata
+        # Under the lock, so a sync can't transform with the old metadata and then clear the flag
+        with self._status_lock:
+            self._current_file_metadata = metadata
+            self._status_dirty = True  # time_remaining depends on the metadata
         logger.info(f"Updated file metadata (estimated_time: {metadata.get('estimated_time')})")
     
     def transform_status_data(self, status_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -93,213 +289,338 @@ class FirebaseSync:
         Transform Moonraker status data to Firestore document format.
         
         Args:
-            status_data: Raw status data from Moonraker
+            status_data: Merged status data, as validated by _merge_status_update
             
         Returns:
             Transformed data structure for Firestore
         """
         transformed = {}
-        progress = None  # Initialize progress to avoid UnboundLocalError
 
         # Extract heater bed data
-        # Only include if values are actually present (not None)
-        if "heater_bed" in status_data:
-            bed_heater = status_data["heater_bed"]
-            if isinstance(bed_heater, dict):
-                bed_data = {}
-                # Only include fields that have actual values
-                if "target" in bed_heater and bed_heater["target"] is not None:
-                    bed_data["target"] = round_value(bed_heater["target"], 0)  # Whole numbers for targets
-                if "temperature" in bed_heater and bed_heater["temperature"] is not None:
-                    bed_data["temperature"] = round_value(bed_heater["temperature"], 1)  # 1 decimal for temps
-
-                # Only add heater_bed if we have at least one valid value
-                if bed_data:
-                    transformed["heater_bed"] = bed_data
-        
-        # Extract extruder heater data if available
-        if "heaters" in status_data:
-            heaters = status_data["heaters"]
-            if isinstance(heaters, dict):
-                for heater_name, heater_data in heaters.items():
-                    if "extruder" in heater_name.lower() or heater_name == "extruder":
-                        if isinstance(heater_data, dict):
-                            extruder_data = {}
-                            # Only include fields that have actual values
-                            if "target" in heater_data and heater_data["target"] is not None:
-                                extruder_data["target"] = round_value(heater_data["target"], 0)  # Whole numbers for targets
-                            if "temperature" in heater_data and heater_data["temperature"] is not None:
-                                extruder_data["temperature"] = round_value(heater_data["temperature"], 1)  # 1 decimal for temps
-
-                            # Only add extruder if we have at least one valid value
-                            if extruder_data:
-                                transformed["extruder"] = extruder_data
-                            break
-
-        # Also check for direct extruder object
-        if "extruder" in status_data and "extruder" not in transformed:
-            extruder_heater = status_data["extruder"]
-            if isinstance(extruder_heater, dict):
-                extruder_data = {}
-                # Only include fields that have actual values
-                if "target" in extruder_heater and extruder_heater["target"] is not None:
-                    extruder_data["target"] = round_value(extruder_heater["target"], 0)  # Whole numbers for targets
-                if "temperature" in extruder_heater and extruder_heater["temperature"] is not None:
-                    extruder_data["temperature"] = round_value(extruder_heater["temperature"], 1)  # 1 decimal for temps
-
-                # Only add extruder if we have at least one valid value
-                if extruder_data:
-                    transformed["extruder"] = extruder_data
-        
-        # Extract print stats
-        if "print_stats" in status_data:
-            print_stats = status_data["print_stats"]
-            if isinstance(print_stats, dict):
-                if "print_stats" not in transformed:
-                    transformed["print_stats"] = {}
-
-                # Only add fields that are actually present
-                if "state" in print_stats:
-                    transformed["print_stats"]["state"] = print_stats["state"]
-
-                if "filename" in print_stats and print_stats["filename"]:
-                    transformed["print_stats"]["filename"] = print_stats["filename"]
-
-                # Duration and time remaining
-                total_duration = print_stats.get("total_duration")
-                print_duration = print_stats.get("print_duration")
-                if print_duration is not None:
-                    transformed["print_stats"]["print_duration"] = round_value(print_duration, 1)
-
-                if total_duration is not None and print_duration is not None:
-                    # Calculate time remaining using estimated_time from metadata if available
-                    estimated_time = self._current_file_metadata.get("estimated_time")
+        bed_data = _extract_heater(status_data.get("heater_bed"))
+        if bed_data:
+            transformed["heater_bed"] = bed_data
+
+        # Extract extruder data, preferring an extruder entry in the heaters
+        # object and falling back to the direct extruder object
+        extruder_data = None
+        heaters = status_data.get("heaters")
+        if heaters is not None:
+            extruder_data = _extract_heater(self._find_extruder(heaters))
+        extruder_data = extruder_data or _extract_heater(status_data.get("extruder"))
+        if extruder_data:
+            transformed["extruder"] = extruder_data
+        
+        # print_stats and virtual_sdcard both feed the print_stats sub-document
+        print_stats = status_data.get("print_stats")
+        sdcard = status_data.get("virtual_sdcard")
+        if print_stats is not None or sdcard is not None:
+            transformed["print_stats"] = self._transform_print_stats(print_stats, sdcard)
+        
+        # Extract display status if available
+        display = status_data.get("display_status")
+        if display is not None:
+            transformed["display_status"] = {
+                "progress": _FIELD_ROUNDERS["progress"](display.get("progress", 0.0)),
+                "message": display.get("message", "")
+            }
+        
+        return transformed
+
+    def _transform_print_stats(self,
+                               print_stats: Optional[Dict[str, Any]],
+                               sdcard: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Build the print_stats sub-document.
+        
+        Kept apart from the heater fields because time_remaining depends on
+        values from both objects and on the current file's metadata.
+        
+        Args:
+            print_stats: The print_stats object from Moonraker, or None
+            sdcard: The virtual_sdcard object from Moonraker, or None
+            
+        Returns:
+            Print fields, only including values that are present
+        """
+        print_data = {}
+        # virtual_sdcard progress is a 0-1 fraction, also used to estimate time remaining
+        progress = sdcard.get("progress") if sdcard is not None else None
+        
+        if print_stats is not None:
+            # Only add fields that are actually present
+            state = print_stats.get("state", _MISSING)
+            if state is not _MISSING:
+                print_data["state"] = state
+
+            filename = print_stats.get("filename")
+            if filename:
+                print_data["filename"] = filename
+
+            # Duration and time remaining
+            total_duration = print_stats.get("total_duration")
+            print_duration = print_stats.get("print_duration")
+            if print_duration is not None:
+                print_data["print_duration"] = _FIELD_ROUNDERS["print_duration"](print_duration)
+
+            if total_duration is not None and print_duration is not None:
+                # Calculate time remaining using estimated_time from metadata if available
+                round_seconds = _FIELD_ROUNDERS["time_remaining"]
+                estimated_time = self._current_file_metadata.get("estimated_time")
+                
+                if estimated_time:
+                    # If we have metadata, use estimated_time - print_duration
+                    time_remaining = max(0, round_seconds(estimated_time - print_duration))
+                elif progress and progress > 0:
+                    # Fallback: Estimate based on progress
+                    # (print_duration / progress) = total_estimated_time
+                    total_estimated = print_duration / progress
+                    time_remaining = max(0, round_seconds(total_estimated - print_duration))
+                else:
+                    # Last resort: just use what we have (though likely incorrect as it includes pause)
+                    time_remaining = max(0, round_seconds(total_duration - print_duration))
                     
-                    if estimated_time:
-                        # If we have metadata, use estimated_time - print_duration
-                        time_remaining = max(0, round_value(estimated_time - print_duration, 0))
-                    elif progress and progress > 0:
-                        # Fallback: Estimate based on progress
-                        # (print_duration / progress) = total_estimated_time
-                        total_estimated = print_duration / progress
-                        time_remaining = max(0, round_value(total_estimated - print_duration, 0))
-                    else:
-                        # Last resort: just use what we have (though likely incorrect as it includes pause)
-                        time_remaining = max(0, round_value(total_duration - print_duration, 0))
-                        
-                    transformed["print_stats"]["time_remaining"] = time_remaining
+                print_data["time_remaining"] = time_remaining
 
         # Extract virtual_sdcard for file_size, filename, and progress
-        if "virtual_sdcard" in status_data:
-            sdcard = status_data["virtual_sdcard"]
-            if isinstance(sdcard, dict):
-                if "print_stats" not in transformed:
-                    transformed["print_stats"] = {}
-
-                # Only add filename if file_path is present and not null
-                file_path = sdcard.get("file_path")
-                if file_path:
-                    transformed["print_stats"]["filename"] = file_path
-
-                # Get progress directly from virtual_sdcard (already a percentage 0-1, convert to 0-100)
-                progress = sdcard.get("progress")
-                if progress is not None:
-                    transformed["print_stats"]["progress"] = round_value(progress * 100, 2)  # Convert 0-1 to 0-100
-
-                # Get file size
-                file_size = sdcard.get("file_size")
-                if file_size and file_size > 0:
-                    transformed["print_stats"]["file_size"] = round_value(file_size, 0)
+        if sdcard is not None:
+            # Only add filename if file_path is present and not null
+            file_path = sdcard.get("file_path")
+            if file_path:
+                print_data["filename"] = file_path
+
+            # Convert progress from 0-1 to 0-100
+            if progress is not None:
+                print_data["progress"] = _FIELD_ROUNDERS["progress"](progress * 100)
+
+            # Get file size
+            file_size = sdcard.get("file_size")
+            if file_size and file_size > 0:
+                print_data["file_size"] = _FIELD_ROUNDERS["file_size"](file_size)
+
+        return print_data
+    
+    def _find_extruder(self, heaters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Find the extruder entry in the Moonraker heaters object.
         
-        # Extract display status if available
-        if "display_status" in status_data:
-            display = status_data["display_status"]
-            if isinstance(display, dict):
-                transformed["display_status"] = {
-                    "progress": round_value(display.get("progress", 0.0), 2),  # 2 decimals for progress
-                    "message": display.get("message", "")
-                }
+        The matching heater name is cached, and the usual "extruder" name is
+        tried directly, so the scan (and lowercasing of every name) only runs
+        for unusually named extruders.
         
-        return transformed
+        Args:
+            heaters: The heaters object from Moonraker
+            
+        Returns:
+            The first heater dict whose name contains "extruder", or None
+        """
+        if self._extruder_key is not None:
+            heater_data = heaters.get(self._extruder_key)
+            if isinstance(heater_data, dict):
+                return heater_data
+        
+        heater_data = heaters.get("extruder")
+        if isinstance(heater_data, dict):
+            self._extruder_key = "extruder"
+            return heater_data
+        
+        for heater_name, heater_data in heaters.items():
+            if "extruder" in heater_name.lower() and isinstance(heater_data, dict):
+                self._extruder_key = heater_name
+                return heater_data
+        return None
     
     def _merge_status_update(self, new_status: Dict[str, Any]):
         """
         Merge new status update into the latest status.
         Moonraker sends partial updates, so we need to merge them.
         
+        This is also where the shape of incoming data is checked: printer
+        objects are always dicts, so anything else is dropped here and
+        transform_status_data can rely on every stored object being a dict.
+        
+        Nested dicts are merged at every depth (with an explicit stack rather
+        than recursion), so a partial nested update never replaces sibling
+        fields. The status is only marked dirty when a field of a synced
+        object actually changes value. Callers must hold _status_lock.
+        
         Args:
             new_status: New status data from Moonraker
         """
         # Deep merge the status data
         for key, value in new_status.items():
-            if key in self._latest_status and isinstance(self._latest_status[key], dict) and isinstance(value, dict):
-                # Recursively merge dictionaries
-                self._latest_status[key].update(value)
-            else:
-                # Replace or add new key
-                self._latest_status[key] = value
+            if not isinstance(value, dict):
+                logger.debug("Ignoring non-object status for %s", key)
+                continue
+            
+            current = self._latest_status.get(key)
+            changed = current is None
+            if changed:
+                # New objects are built up from empty dicts, so later merges
+                # never mutate the caller's data
+                current = self._latest_status[key] = {}
+            
+            # Merge changed fields into the existing object, depth first
+            stack = [(current, value)]
+            while stack:
+                target, source = stack.pop()
+                for field, field_value in source.items():
+                    if isinstance(field_value, dict):
+                        nested = target.get(field)
+                        if not isinstance(nested, dict):
+                            nested = target[field] = {}
+                            changed = True
+                        stack.append((nested, field_value))
+                    elif target.get(field, _MISSING) != field_value:
+                        target[field] = field_value
+                        changed = True
+            
+            if changed and key in _SYNCED_OBJECTS:
+                self._status_dirty = True
+    
+    def _fold_pending_updates(self):
+        """Merge all queued Moonraker frames into the latest status, oldest first."""
+        pending = self._pending_updates
+        with self._status_lock:
+            while pending:
+                self._merge_status_update(pending.popleft())
     
-    def update_status(self, status_data: Dict[str, Any]):
+    def update_status(self, status_data: Dict[str, Any]) -> bool:
         """
         Update the latest status data (does not sync to Firebase immediately).
         This method is called for each status update from Moonraker.
+        
+        The frame is only queued here; merging is deferred to the next
+        sync so the per-frame cost on the event loop stays O(1).
 
         Args:
             status_data: Raw status data from Moonraker
+            
+        Returns:
+            True if the print state changed, so the caller should sync now
+            rather than wait for the next sync interval
         """
-        # Merge the new status into our stored status
-        self._merge_status_update(status_data)
-        logger.debug(f"Updated latest status (keys: {list(status_data.keys())})")
+        state_changed = False
+        print_stats = status_data.get("print_stats")
+        if isinstance(print_stats, dict):
+            state = print_stats.get("state")
+            if state is not None and state != self._last_print_state:
+                self._last_print_state = state
+                state_changed = True
+        
+        self._pending_updates.append(status_data)
+        if len(self._pending_updates) >= _MAX_PENDING_UPDATES:
+            # Syncing has fallen behind; fold now to bound memory
+            self._fold_pending_updates()
+        # Called for every Moonraker frame: only build the key list if it will be logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Updated latest status (keys: %s)", list(status_data))
+        return state_changed
     
-    def sync_status(self, status_data: Optional[Dict[str, Any]] = None):
+    def sync_status(self, status_data: Optional[Dict[str, Any]] = None, force: bool = False) -> Optional[float]:
         """
         Sync printer status to Firestore.
         If status_data is provided, it will be merged and synced.
         Otherwise, the latest stored status will be synced.
+        Writes are rate limited to one per SYNC_MIN_INTERVAL; a skipped
+        sync keeps its data merged and is picked up by the next one.
 
         Args:
             status_data: Optional raw status data from Moonraker (will be merged if provided)
+            force: Write even if the minimum sync interval has not elapsed
+            
+        Returns:
+            Seconds until the deferred data can be written if the sync was
+            rate limited, otherwise None
         """
         if not self._initialized or not self.db:
             logger.error("Firebase not initialized")
             return
 
         try:
-            # If new data provided, merge it first
+            # If new data provided, queue it, then merge everything queued so far
             if status_data:
-                self._merge_status_update(status_data)
+                self._pending_updates.append(status_data)
+            self._fold_pending_updates()
             
             # If no status data stored, nothing to sync
             if not self._latest_status:
                 logger.debug("No status data to sync")
                 return
 
-            # Transform the latest merged status
-            transformed_data = self.transform_status_data(self._latest_status)
-
-            # Check if data has changed since last sync
-            if transformed_data == self._last_synced_data:
+            # Coalesce bursts of syncs into at most one write per interval
+            now = time.monotonic()
+            remaining = self._min_sync_interval - (now - self._last_sync_time)
+            if not force and remaining > 0:
+                logger.debug("Last sync was too recent, deferring")
+                return remaining
+
+            # Transform the latest merged status, unless nothing arrived since the last sync
+            with self._status_lock:
+                if not self._status_dirty:
+                    logger.debug("No status updates since last sync")
+                    return
+                transformed_data = self.transform_status_data(self._latest_status)
+                self._status_dirty = False
+
+            # Only send the leaf fields that changed since the last sync
+            last_synced = self._last_synced_data
+            changed_fields = {
+                path: value
+                for path, value in _flatten(transformed_data)
+                if last_synced.get(path, _MISSING) != value
+            }
+            if not changed_fields:
                 logger.debug("Status has not changed, skipping sync")
                 return
 
             # Log what we're syncing
-            logger.debug(f"Syncing status to Firestore (keys: {list(transformed_data.keys())})")
-            if "print_stats" in transformed_data:
-                logger.debug(f"Print stats: {transformed_data['print_stats']}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Syncing status to Firestore (changed: %s)", changed_fields)
 
-            # Update Firestore document
-            doc_ref = self.db.collection(Config.FIRESTORE_COLLECTION).document("current")
-            doc_ref.set(transformed_data, merge=True)
+            # Update only the changed fields (no server-side map merge),
+            # letting the server stamp the write time
+            update_data = {**changed_fields, "timestamp": self._server_timestamp}
+            try:
+                self._doc_ref.update(update_data, retry=self._write_retry, timeout=_WRITE_TIMEOUT)
+            except self._not_found:
+                # First write: update() can't create the document
+                logger.info("Status document not found, creating it")
+                self._doc_ref.set(
+                    {**transformed_data, "timestamp": self._server_timestamp},
+                    merge=True,
+                    retry=self._write_retry,
+                    timeout=_WRITE_TIMEOUT,
+                )
             
-            # Update last synced data
-            self._last_synced_data = transformed_data.copy()
+            # Record what Firestore now holds (values are leaves, so no copy is needed)
+            last_synced.update(changed_fields)
+            self._last_sync_time = now
 
-            logger.info("Synced printer status to Firestore")
+            self._sync_count += 1
+            if self._sync_count % _SYNC_LOG_EVERY == 1:
+                logger.info("Synced printer status to Firestore (%d writes so far)", self._sync_count)
+            else:
+                logger.debug("Synced printer status to Firestore")
 
         except Exception as e:
             logger.error(f"Failed to sync status to Firestore: {e}")
+            # Retry on the next sync even if no new updates arrive
+            self._status_dirty = True
             # Don't raise - we want to continue even if one sync fails
 
+    def flush(self):
+        """Write the latest status to Firestore, ignoring the rate limit."""
+        self.sync_status(force=True)
+
+    def close(self):
+        """Release background resources (queue listener, notification worker threads and HTTP session)."""
+        if self._queue_listener is not None:
+            self._queue_listener.unsubscribe()
+            self._queue_listener = None
+        self._notify_pool.shutdown(wait=False)
+        self._http.close()
+
     def _setup_queue_listener(self):
         """Setup listener for print queue changes."""
         try:
@@ -313,24 +634,24 @@ class FirebaseSync:
         """
         Callback for print queue snapshot updates.
         
+        Runs on the Firestore listener thread, so notifications are only
+        submitted here; the queue is updated once they finish (see
+        _track_notifications) and this callback returns immediately.
+        
         Args:
             doc_snapshot: List of DocumentSnapshot (should be length 1)
             changes: List of changes
             read_time: Time of read
         """
         try:
+            jobs = []  # (document reference, (document id, user id), future)
+            
             for doc in doc_snapshot:
                 data = doc.to_dict()
-                if not data or "queue" not in data:
-                    continue
-
-                queue_list = data["queue"]
+                queue_list = data.get("queue") if data else None
                 if not isinstance(queue_list, list):
                     continue
 
-                updated = False
-                new_queue = []
-                
                 for item in queue_list:
                     # Check if item needs notification
                     if (isinstance(item, dict) and 
@@ -339,24 +660,146 @@ class FirebaseSync:
                         
                         user_id = item.get("requested_by")
                         if user_id:
+                            # Snapshots arriving before the flag is written must not notify again
+                            key = (doc.id, user_id)
+                            with self._notify_lock:
+                                if key in self._notify_inflight:
+                                    continue
+                                self._notify_inflight.add(key)
+                            
                             stream_preference = item.get("stream_preference", "public")
                             private_link = item.get("private_stream_link")
                             
                             logger.info(f"Found new printing job for user {user_id}, sending notification...")
-                            if self._send_notification(user_id, stream_preference, private_link):
-                                item["start_msg_sent"] = True
-                                updated = True
-                    
-                    new_queue.append(item)
+                            future = self._notify_pool.submit(
+                                self._send_notification, user_id, stream_preference, private_link
+                            )
+                            jobs.append((doc.reference, key, future))
 
-                # If we modified any items, update the document
-                if updated:
-                    doc.reference.update({"queue": new_queue})
-                    logger.info("Updated print queue with notification status")
+            if jobs:
+                self._track_notifications(jobs)
 
         except Exception as e:
             logger.error(f"Error in queue snapshot listener: {e}")
 
+    def _track_notifications(self, jobs: List[Tuple[Any, Tuple[str, str], Any]]):
+        """
+        Mark the queue once every notification from one snapshot has finished.
+        
+        Args:
+            jobs: (document reference, (document id, user id), future) per notification
+        """
+        remaining = [len(jobs)]
+        
+        def on_done(_future):
+            with self._notify_lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            # add_done_callback runs this on the snapshot listener thread when the
+            # future has already finished, so the Firestore write is handed off
+            self._notify_pool.submit(self._mark_notified, jobs)
+        
+        for _, _, future in jobs:
+            future.add_done_callback(on_done)
+
+    def _mark_notified(self, jobs: List[Tuple[Any, Tuple[str, str], Any]]):
+        """
+        Set start_msg_sent on queue items whose notification was sent.
+        
+        Each document is updated in its own transaction, so a queue change
+        made while the notifications were being sent is read first and a
+        concurrent write makes the transaction retry instead of being lost.
+        
+        Args:
+            jobs: (document reference, (document id, user id), finished future) per notification
+        """
+        try:
+            # Users notified successfully, per document
+            sent: Dict[str, Tuple[Any, Set[str]]] = {}
+            for doc_ref, (doc_id, user_id), future in jobs:
+                if future.result():
+                    sent.setdefault(doc_id, (doc_ref, set()))[1].add(user_id)
+            
+            updated_docs = 0
+            for doc_ref, user_ids in sent.values():
+                # A fresh wrapper per call, since it tracks the state of one transaction
+                mark = self._transactional(self._mark_queue_items)
+                if mark(self.db.transaction(), doc_ref, user_ids):
+                    updated_docs += 1
+            
+            if updated_docs:
+                logger.info("Updated print queue with notification status")
+        
+        except Exception as e:
+            logger.error(f"Error updating print queue notification status: {e}")
+        finally:
+            # Failed notifications become eligible again on the next snapshot
+            with self._notify_lock:
+                self._notify_inflight.difference_update(key for _, key, _ in jobs)
+
+    @staticmethod
+    def _mark_queue_items(transaction, doc_ref, user_ids: Set[str]) -> bool:
+        """
+        Set start_msg_sent on a queue document's printing items for the given users.
+        
+        Runs inside a Firestore transaction and may be retried on contention.
+        
+        Args:
+            transaction: Transaction the read and write belong to
+            doc_ref: Queue document reference
+            user_ids: Users whose notification was sent
+            
+        Returns:
+            True if the document was updated
+        """
+        data = doc_ref.get(transaction=transaction).to_dict()
+        queue_list = data.get("queue") if data else None
+        if not isinstance(queue_list, list):
+            return False
+        
+        updated = False
+        for item in queue_list:
+            if (isinstance(item, dict) and 
+                item.get("status") == "printing" and 
+                not item.get("start_msg_sent", False) and 
+                item.get("requested_by") in user_ids):
+                item["start_msg_sent"] = True
+                updated = True
+        
+        # Firestore can't address array elements by path, so the array is rewritten
+        if updated:
+            transaction.update(doc_ref, {"queue": queue_list})
+        return updated
+
+    def _get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a user's profile, cached for _USER_CACHE_TTL seconds.
+        
+        Args:
+            user_id: The user ID to look up
+            
+        Returns:
+            The user document data, or None if the user doesn't exist
+        """
+        now = time.monotonic()
+        with self._user_cache_lock:
+            entry = self._user_cache.get(user_id)
+        if entry and now - entry[0] < _USER_CACHE_TTL:
+            return entry[1]
+        
+        user_doc = self.db.collection("users").document(user_id).get()
+        if not user_doc.exists:
+            return None
+        
+        user_data = user_doc.to_dict()
+        with self._user_cache_lock:
+            self._user_cache.pop(user_id, None)  # Re-insert so the oldest entry is evicted first
+            self._user_cache[user_id] = (now, user_data)
+            if len(self._user_cache) > _USER_CACHE_MAX:
+                del self._user_cache[next(iter(self._user_cache))]
+        return user_data
+
     def _send_notification(self, user_id: str, stream_preference: str = "public", private_link: Optional[str] = None) -> bool:
         """
         Send WhatsApp notification to user.
@@ -369,14 +812,18 @@ class FirebaseSync:
         Returns:
             True if notification sent successfully, False otherwise
         """
+        # Don't tie up a worker while the WhatsApp API is known to be failing
+        if time.monotonic() < self._wa_open_until:
+            logger.warning(f"WhatsApp API unavailable, skipping notification for user {user_id}")
+            return False
+        
         try:
             # 1. Get user's phone number and name
-            user_doc = self.db.collection("users").document(user_id).get()
-            if not user_doc.exists:
+            user_data = self._get_user(user_id)
+            if user_data is None:
                 logger.warning(f"User {user_id} not found")
                 return False
             
-            user_data = user_doc.to_dict()
             phone_number = user_data.get("phone_number")
             user_name = user_data.get("display_name") or user_data.get("name") or "User"
             
@@ -394,20 +841,20 @@ class FirebaseSync:
             message = f"Hello {user_name}, Your 3D printing has started. You can watch the live stream here: {stream_link}"
             
             # 4. Call local API to send WhatsApp message
-            api_url = Config.WHATSAPP_API_URL
+            api_url = self._whatsapp_api_url
             payload = {
                 "number": phone_number,
                 "message": message
             }
             
-            logger.debug(f"Calling WhatsApp API for {phone_number}")
-            response = requests.post(
-                api_url, 
-                json=payload, 
-                headers={'Content-Type': 'application/json'},
-                timeout=10
-            )
+            logger.debug("Calling WhatsApp API for %s", phone_number)
+            try:
+                response = self._http.post(api_url, json=payload, timeout=_WHATSAPP_TIMEOUT)
+            except Exception:
+                self._record_whatsapp_result(False)
+                raise
             
+            self._record_whatsapp_result(response.status_code == 200)
             if response.status_code == 200:
                 logger.info(f"WhatsApp message sent successfully to {phone_number}")
                 return True
@@ -419,3 +866,24 @@ class FirebaseSync:
             logger.error(f"Error sending notification: {e}")
             return False
 
+    def _record_whatsapp_result(self, success: bool):
+        """
+        Track consecutive WhatsApp API failures, opening the circuit breaker
+        for _BREAKER_COOLDOWN seconds after _BREAKER_THRESHOLD of them.
+        
+        Args:
+            success: Whether the API call succeeded
+        """
+        with self._notify_lock:
+            if success:
+                self._wa_failures = 0
+                return
+            self._wa_failures += 1
+            if self._wa_failures >= _BREAKER_THRESHOLD:
+                self._wa_open_until = time.monotonic() + _BREAKER_COOLDOWN
+                self._wa_failures = 0
+                logger.warning(
+                    f"WhatsApp API failed {_BREAKER_THRESHOLD} times in a row, "
+                    f"pausing notifications for {_BREAKER_COOLDOWN:.0f} seconds"
+                )
+
@@ -3,6 +3,7 @@ import asyncio
 import logging
 import signal
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from moonraker_client import MoonrakerClient
 from firebase_sync import FirebaseSync
@@ -17,6 +18,9 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Seconds to wait for the final Firestore write before giving up on shutdown
+SHUTDOWN_SYNC_TIMEOUT = 10.0
+
 
 class PrinterDataSync:
     """Main application class for syncing printer data."""
@@ -27,6 +31,15 @@ class PrinterDataSync:
         self.moonraker_client: MoonrakerClient = None
         self.running = False
         self._sync_task: Optional[asyncio.Task] = None
+        self._client_task: Optional[asyncio.Task] = None
+        # Firestore writes block, so they run on their own thread rather than
+        # the event loop (or the default executor shared with other work). A
+        # single worker keeps writes in order: the final flush on shutdown
+        # queues behind any sync that is still running
+        self._sync_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="firestore")
+        # Set when the print state changes, to sync without waiting for the interval
+        self._flush_event = asyncio.Event()
+        self._force_sync = False  # Next woken sync ignores SYNC_MIN_INTERVAL
         self._setup_signal_handlers()
     
     def _setup_signal_handlers(self):
@@ -34,6 +47,9 @@ class PrinterDataSync:
         def signal_handler(sig, frame):
             logger.info("Received shutdown signal, shutting down gracefully...")
             self.running = False
+            # The Moonraker client runs until cancelled; wake the loop to cancel it
+            if self._client_task and not self._client_task.done():
+                self._client_task.get_loop().call_soon_threadsafe(self._client_task.cancel)
         
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
@@ -42,21 +58,26 @@ class PrinterDataSync:
         """Callback for Moonraker status updates."""
         try:
             # Check for filename change to fetch metadata
-            if "print_stats" in status_data and "filename" in status_data["print_stats"]:
-                filename = status_data["print_stats"]["filename"]
+            print_stats = status_data.get("print_stats")
+            if print_stats:
+                filename = print_stats.get("filename")
                 if filename:
                     # Fetch metadata asynchronously
                     asyncio.create_task(self._fetch_metadata(filename))
             
             # Also check virtual_sdcard for filename (sometimes it appears there)
-            if "virtual_sdcard" in status_data and "file_path" in status_data["virtual_sdcard"]:
-                filename = status_data["virtual_sdcard"]["file_path"]
+            sdcard = status_data.get("virtual_sdcard")
+            if sdcard:
+                filename = sdcard.get("file_path")
                 if filename:
                     asyncio.create_task(self._fetch_metadata(filename))
 
-            # Store the update but don't sync immediately
-            # Sync will happen periodically via the sync task
-            self.firebase_sync.update_status(status_data)
+            # Store the update; it is synced by the periodic sync task, which
+            # is woken early depending on SYNC_MODE
+            state_changed = self.firebase_sync.update_status(status_data)
+            if Config.SYNC_MODE == "immediate" or (state_changed and Config.SYNC_MODE == "hybrid"):
+                self._force_sync = self._force_sync or state_changed
+                self._flush_event.set()
         except Exception as e:
             logger.error(f"Error handling status update: {e}")
 
@@ -70,17 +91,42 @@ class PrinterDataSync:
         except Exception as e:
             logger.error(f"Error fetching metadata for {filename}: {e}")
     
+    async def _run_sync(self, force: bool = False) -> Optional[float]:
+        """
+        Sync the latest status to Firebase on the sync executor.
+        
+        Args:
+            force: Write even if the minimum sync interval has not elapsed
+            
+        Returns:
+            Seconds until a rate-limited sync can be retried, or None if nothing was deferred
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._sync_executor, self.firebase_sync.sync_status, None, force)
+    
     async def _periodic_sync(self):
         """Periodic task to sync status to Firebase."""
         sync_interval = Config.SYNC_INTERVAL
-        logger.info(f"Starting periodic sync task (interval: {sync_interval} seconds)")
+        logger.info(f"Starting periodic sync task (interval: {sync_interval} seconds, mode: {Config.SYNC_MODE})")
         
+        timeout = sync_interval
         while self.running:
             try:
-                await asyncio.sleep(sync_interval)
+                # Wait for the interval, or less if a status update wakes us
+                try:
+                    await asyncio.wait_for(self._flush_event.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_event.clear()
+                force, self._force_sync = self._force_sync, False
+                
                 if self.running:
-                    # Sync the latest status to Firebase
-                    self.firebase_sync.sync_status()
+                    # Sync off the event loop so the blocking Firestore write
+                    # doesn't stall Moonraker message handling
+                    deferred = await self._run_sync(force)
+                    # A rate-limited sync is retried as soon as the limit allows,
+                    # so an update that arrived too early isn't left waiting
+                    timeout = sync_interval if deferred is None else min(sync_interval, deferred)
             except asyncio.CancelledError:
                 logger.info("Periodic sync task cancelled")
                 break
@@ -112,24 +158,14 @@ class PrinterDataSync:
             self._sync_task = asyncio.create_task(self._periodic_sync())
             logger.info(f"Periodic sync task started (every {Config.SYNC_INTERVAL} seconds)")
             
-            # Main loop with reconnection logic
-            while self.running:
-                try:
-                    # Connect to Moonraker
-                    if not self.moonraker_client.connected:
-                        await self.moonraker_client.connect()
-                    
-                    # Listen for updates
-                    await self.moonraker_client.listen()
-                    
-                except Exception as e:
-                    logger.error(f"Error in main loop: {e}")
-                    
-                    if self.running:
-                        logger.info("Attempting to reconnect...")
-                        await self.moonraker_client.reconnect()
-                    else:
-                        break
+            # Connect, listen and reconnect until shutdown
+            self._client_task = asyncio.create_task(self.moonraker_client.run())
+            try:
+                await self._client_task
+            except asyncio.CancelledError:
+                if self.running:
+                    raise
+                logger.info("Moonraker client stopped")
         
         except KeyboardInterrupt:
             logger.info("Interrupted by user")
@@ -153,7 +189,16 @@ class PrinterDataSync:
         # Sync final status before shutdown
         if self.firebase_sync:
             logger.info("Syncing final status before shutdown...")
-            self.firebase_sync.sync_status()
+            loop = asyncio.get_running_loop()
+            try:
+                await asyncio.wait_for(
+                    loop.run_in_executor(self._sync_executor, self.firebase_sync.flush),
+                    timeout=SHUTDOWN_SYNC_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"Final sync did not finish within {SHUTDOWN_SYNC_TIMEOUT} seconds")
+            self.firebase_sync.close()
+        self._sync_executor.shutdown(wait=False)
         
         if self.moonraker_client:
             await self.moonraker_client.disconnect()
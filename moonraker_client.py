@@ -1,65 +1,165 @@
 """Moonraker WebSocket client for real-time printer status updates."""
 import asyncio
+import itertools
 import json
 import logging
 import websockets
-from typing import Dict, Any, Optional, Callable
-from urllib.parse import urlparse
+from websockets.asyncio.client import ClientConnection, connect
+from typing import Dict, Any, Optional, Callable, Union
+
+# orjson parses Moonraker frames several times faster; fall back to the stdlib if it isn't installed.
+# Requests are serialized straight to UTF-8 bytes, which is what goes on the wire.
+try:
+    import orjson
+    
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    # Shared instances skip json.loads/dumps argument handling and encoding detection;
+    # Moonraker frames are always UTF-8, and requests are sent without whitespace
+    _decode = json.JSONDecoder().decode
+    _encode = json.JSONEncoder(separators=(",", ":")).encode
+    
+    def _json_loads(message: Union[bytes, str]) -> Any:
+        return _decode(message.decode() if isinstance(message, bytes) else message)
+    
+    def _json_dumps(obj: Any) -> bytes:
+        return _encode(obj).encode()
 
 logger = logging.getLogger(__name__)
 
+# Printer objects to subscribe to, serialized once since they never change.
+# Based on actual printer objects: heater_bed, heaters, print_stats, display_status, etc.
+_SUBSCRIBE_PARAMS_JSON = _json_dumps({
+    "objects": {
+        "heater_bed": None,
+        "extruder": None,  # Direct extruder object for temperature
+        "heaters": None,  # May contain additional heater info
+        "print_stats": None,
+        "display_status": None,
+        "gcode_move": None,
+        "virtual_sdcard": None
+    }
+})
+
+# Seconds to wait for a JSON-RPC response before giving up on the request
+_REQUEST_TIMEOUT = 10.0
+
+# Status updates arriving within this many seconds are delivered as one callback
+_COALESCE_WINDOW = 0.1
+
+
+def _retry_connect_error(exc: Exception) -> Optional[Exception]:
+    """
+    Decide whether a failed connection attempt is retried by connect().
+    
+    The library only retries network errors and 5xx responses by default,
+    so a 4xx or a bad handshake while Moonraker restarts would end run().
+    Every failure is retried instead, except an invalid URL, which can
+    never succeed.
+    
+    Args:
+        exc: Exception raised while opening the connection
+        
+    Returns:
+        The exception to raise, or None to retry
+    """
+    if isinstance(exc, websockets.exceptions.InvalidURI):
+        return exc
+    return None
+
 
 class MoonrakerClient:
     """WebSocket client for Moonraker JSON-RPC 2.0 API."""
     
-    def __init__(self, ws_url: str, on_status_update: Callable[[Dict[str, Any]], None]):
+    def __init__(self, ws_url: str, on_status_update: Callable[[Dict[str, Any]], None],
+                 compress: bool = False):
         """
         Initialize Moonraker client.
         
         Args:
             ws_url: WebSocket URL (e.g., ws://printer.local/websocket)
             on_status_update: Callback function for status updates
+            compress: Use permessage-deflate; only worth it over slow (WAN) links
         """
         self.ws_url = ws_url
+        self.compress = compress
+        self._resolved_ws_url = self._resolve_ws_url(ws_url)  # Reused on every reconnect
         self.on_status_update = on_status_update
-        self.websocket: Optional[websockets.WebSocketClientProtocol] = None
+        self.websocket: Optional[ClientConnection] = None
         self.connected = False
-        self._reconnect_delay = 1
-        self._max_reconnect_delay = 60
-        self._request_id = 0
+        self._request_ids = itertools.count(1)
         self._subscription_id: Optional[int] = None
         self._pending_requests: Dict[int, asyncio.Future] = {}
+        self._last_status: Dict[str, Dict[str, Any]] = {}  # Last reported value of every field
+        self._pending_update: Dict[str, Any] = {}  # Changes waiting for the next coalesced callback
+        self._flush_task: Optional[asyncio.Task] = None
+        # Handlers for Moonraker notifications, keyed by JSON-RPC method
+        self._notification_handlers: Dict[str, Callable[[Any], None]] = {
+            "notify_status_update": self._handle_status_update,
+        }
+        
+    @staticmethod
+    def _resolve_ws_url(url: str) -> str:
+        """
+        Convert an HTTP(S) Moonraker URL to its WebSocket endpoint.
         
+        Args:
+            url: ws(s):// WebSocket URL, or http(s):// base URL of Moonraker
+            
+        Returns:
+            The WebSocket URL to connect to
+        """
+        if url.startswith("http://"):
+            return "ws://" + url[len("http://"):] + "/websocket"
+        if url.startswith("https://"):
+            return "wss://" + url[len("https://"):] + "/websocket"
+        return url
+    
     def _get_next_request_id(self) -> int:
         """Get next JSON-RPC request ID."""
-        self._request_id += 1
-        return self._request_id
+        return next(self._request_ids)
     
-    async def _send_request(self, method: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """Send JSON-RPC 2.0 request and wait for response."""
+    async def _send_request(self, method: str,
+                            params: Optional[Union[Dict[str, Any], bytes]] = None) -> Dict[str, Any]:
+        """
+        Send JSON-RPC 2.0 request and wait for response.
+        
+        Args:
+            method: JSON-RPC method name
+            params: Request parameters, either a dict or already serialized JSON bytes
+            
+        Returns:
+            The JSON-RPC response
+        """
         if not self.websocket:
             raise ConnectionError("WebSocket not connected")
         
+        # Only the id varies between requests, so the envelope is formatted directly
         request_id = self._get_next_request_id()
-        request = {
-            "jsonrpc": "2.0",
-            "method": method,
-            "id": request_id
-        }
-        
         if params:
-            request["params"] = params
+            params_json = params if isinstance(params, bytes) else _json_dumps(params)
+            request = b'{"jsonrpc":"2.0","method":"%s","id":%d,"params":%s}' % (
+                method.encode(), request_id, params_json
+            )
+        else:
+            request = b'{"jsonrpc":"2.0","method":"%s","id":%d}' % (method.encode(), request_id)
             
         # Create a future to wait for the response
         future = asyncio.get_running_loop().create_future()
         self._pending_requests[request_id] = future
         
         try:
-            await self.websocket.send(json.dumps(request))
-            logger.debug(f"Sent request: {method} (id: {request_id})")
+            # Send the UTF-8 bytes as a text frame without re-encoding them
+            await self.websocket.send(request, text=True)
+            logger.debug("Sent request: %s (id: %d)", method, request_id)
             
-            # Wait for response via the listen loop
-            response_data = await future
+            # Wait for response via the listen loop; a lost response must not
+            # leave the request pending forever
+            try:
+                response_data = await asyncio.wait_for(future, timeout=_REQUEST_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"No response to {method} within {_REQUEST_TIMEOUT} seconds") from None
             
             if "error" in response_data:
                 error = response_data["error"]
@@ -90,82 +190,51 @@ class MoonrakerClient:
             logger.error(f"Failed to get metadata for {filename}: {e}")
             return {}
     
-    async def connect(self):
-        """Connect to Moonraker WebSocket."""
-        try:
-            # Parse URL and convert to WebSocket URL if needed
-            parsed = urlparse(self.ws_url)
-            if parsed.scheme == "http":
-                ws_url = self.ws_url.replace("http://", "ws://") + "/websocket"
-            elif parsed.scheme == "https":
-                ws_url = self.ws_url.replace("https://", "wss://") + "/websocket"
-            else:
-                ws_url = self.ws_url
-            
-            logger.info(f"Connecting to Moonraker at {ws_url}")
-            self.websocket = await websockets.connect(ws_url)
+    async def run(self):
+        """
+        Connect to Moonraker and listen for updates until cancelled.
+        
+        Iterating over connect() makes the websockets library reconnect
+        with its own jittered exponential backoff whenever the connection
+        drops or can't be opened (see _retry_connect_error). Each connection owns its subscribe task,
+        which is cancelled with the connection; keepalive pings are sent by
+        the library.
+        """
+        ws_url = self._resolved_ws_url
+        logger.info(f"Connecting to Moonraker at {ws_url}")
+        # Status frames are small and usually cross a LAN, so compression only costs CPU
+        compression = "deflate" if self.compress else None
+        async for websocket in connect(
+            ws_url, compression=compression, max_queue=64, process_exception=_retry_connect_error
+        ):
+            self.websocket = websocket
             self.connected = True
-            self._reconnect_delay = 1
+            # The new subscription reports the full status again
+            self._last_status.clear()
             logger.info("Connected to Moonraker WebSocket")
             
-            # Subscribe to printer status updates
-            # Note: This calls _send_request, which now relies on the listen loop being active.
-            # However, we haven't started the listen loop yet. 
-            # We need to start the listen loop concurrently or change how we subscribe.
-            # Ideally, subscribe should happen after listen starts, or listen should handle the handshake.
-            # But since we are in a simple script, we can't easily split them without major refactor.
-            # Wait! If we call subscribe here, it will await _send_request -> await future.
-            # But nothing is resolving the future because listen() isn't running!
-            # FIX: We should NOT subscribe here. We should subscribe in the listen loop or 
-            # start a background task for listening immediately after connect.
-            
-            # For now, let's just return and let the caller call listen().
-            # But wait, the caller calls listen() which blocks.
-            # We need to change the architecture slightly.
-            # The listen loop handles ALL incoming messages.
-            # We should probably send the subscribe request *after* the listen loop starts?
-            # Or, we can spawn the listen loop as a task?
-            
-            # Let's modify the main.py to start listen as a task?
-            # Or better, let's make subscribe_to_status fire-and-forget or handle it differently.
-            
-            # Actually, the cleanest way is to have listen() be the main driver.
-            # But we need to send the subscribe request.
-            
-            # Let's change connect to NOT subscribe.
-            # And add a method `on_connect` that sends the subscription.
-            # But `on_connect` needs to be async and awaited.
-            
-            # Alternative: In `listen`, we can check if we are subscribed. If not, subscribe.
-            
-        except Exception as e:
-            logger.error(f"Failed to connect to Moonraker: {e}")
-            self.connected = False
-            raise
+            # Subscribe once the listen loop is running to receive the response
+            subscribe_task = asyncio.create_task(self.subscribe_to_status())
+            try:
+                await self.listen()
+            except websockets.exceptions.ConnectionClosed:
+                logger.info("Reconnecting to Moonraker...")
+            except Exception as e:
+                logger.error(f"Error in Moonraker connection: {e}")
+                await websocket.close()
+            finally:
+                subscribe_task.cancel()
             
     async def subscribe_to_status(self):
         """Subscribe to printer object status updates."""
         try:
             # Subscribe to printer objects
-            # Based on actual printer objects: heater_bed, heaters, print_stats, display_status, etc.
-            params = {
-                "objects": {
-                    "heater_bed": None,
-                    "extruder": None,  # Direct extruder object for temperature
-                    "heaters": None,  # May contain additional heater info
-                    "print_stats": None,
-                    "display_status": None,
-                    "gcode_move": None,
-                    "virtual_sdcard": None
-                }
-            }
-
-            response = await self._send_request("printer.objects.subscribe", params)
+            response = await self._send_request("printer.objects.subscribe", _SUBSCRIBE_PARAMS_JSON)
             result = response.get("result", {})
             self._subscription_id = result.get("subscription_id")
 
             # Get initial status from subscription response
-            status = result.get("status", {})
+            status = self._filter_changes(result.get("status", {}))
             if status:
                 logger.info("Received initial status from subscription")
                 self.on_status_update(status)
@@ -179,47 +248,118 @@ class MoonrakerClient:
             logger.error(f"Failed to subscribe to status updates: {e}")
             # Don't raise here to avoid crashing the loop if subscription fails temporarily
     
+    def _handle_status_update(self, params: Any):
+        """
+        Handle a notify_status_update notification.
+        
+        Args:
+            params: Notification params; Moonraker sends an array: [{status_data}, eventtime]
+        """
+        # Assume the usual shape and let malformed params fail instead of checking up front
+        try:
+            status_data = params[0]
+            if type(status_data) is not dict:
+                # Fallback: [subscription_id, {status_data}]
+                status_data = params[1]
+        except (IndexError, KeyError, TypeError):
+            logger.debug("Ignoring malformed status update")
+            return
+        if type(status_data) is not dict:
+            logger.debug("Ignoring malformed status update")
+            return
+        
+        changes = self._filter_changes(status_data)
+        if not changes:
+            return
+        
+        # Moonraker sends bursts of small frames; collect them and report once per window
+        pending = self._pending_update
+        for key, value in changes.items():
+            if isinstance(value, dict) and isinstance(pending.get(key), dict):
+                pending[key].update(value)
+            else:
+                pending[key] = value
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after(_COALESCE_WINDOW))
+    
+    async def _flush_after(self, delay: float):
+        """
+        Deliver the coalesced status changes after a short delay.
+        
+        Args:
+            delay: Seconds to wait for more updates before calling on_status_update
+        """
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self._flush_task = None
+        
+        status_data, self._pending_update = self._pending_update, {}
+        if status_data:
+            # Once per coalescing window rather than per frame; only build the key list if logged
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Received status update from Moonraker (keys: %s)", list(status_data))
+            try:
+                self.on_status_update(status_data)
+            except Exception as e:
+                logger.error(f"Error processing status update: {e}")
+    
+    def _filter_changes(self, status_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Drop fields whose value hasn't changed since they were last reported.
+        
+        Args:
+            status_data: Status update from Moonraker
+            
+        Returns:
+            The changed fields of each object (objects without changes are omitted)
+        """
+        changes = {}
+        for key, fields in status_data.items():
+            if not isinstance(fields, dict):
+                changes[key] = fields
+                continue
+            
+            last = self._last_status.setdefault(key, {})
+            changed = {}
+            for field, value in fields.items():
+                if field in last and last[field] == value:
+                    continue
+                last[field] = value
+                changed[field] = value
+            
+            if changed:
+                changes[key] = changed
+        return changes
+    
     async def listen(self):
         """Listen for messages from Moonraker."""
         if not self.websocket:
             raise ConnectionError("WebSocket not connected")
         
-        # Start subscription as a background task once we start listening
-        # This ensures the listen loop is running to handle the response
-        asyncio.create_task(self.subscribe_to_status())
-        
         try:
-            async for message in self.websocket:
+            while True:
+                # Frames are parsed straight from bytes, skipping the library's UTF-8 decode
+                message = await self.websocket.recv(decode=False)
                 try:
-                    data = json.loads(message)
-                    
-                    # Handle responses to pending requests
-                    if "id" in data and data["id"] in self._pending_requests:
-                        request_id = data["id"]
-                        future = self._pending_requests[request_id]
-                        if not future.done():
-                            future.set_result(data)
-                        continue
+                    data = _json_loads(message)
+                    method = data.get("method")
                     
-                    # Handle notifications (status updates)
-                    if "method" in data and data["method"] == "notify_status_update":
-                        # Moonraker sends params as an array: [subscription_id, {status_data}]
-                        params = data.get("params", [])
-                        if len(params) >= 2 and isinstance(params[1], dict):
-                            status_data = params[1]
-                            logger.debug("Received status update from Moonraker")
-                            self.on_status_update(status_data)
-                        elif len(params) >= 1 and isinstance(params[0], dict):
-                            # Fallback: sometimes it's just the status data
-                            status_data = params[0]
-                            logger.debug("Received status update from Moonraker")
-                            self.on_status_update(status_data)
+                    # Handle notifications (status updates are almost every frame)
+                    if method is not None:
+                        handler = self._notification_handlers.get(method)
+                        if handler:
+                            handler(data.get("params", []))
+                        else:
+                            logger.debug("Received notification: %s", method)
                     
-                    # Handle other notifications
-                    elif "method" in data:
-                        logger.debug(f"Received notification: {data['method']}")
+                    # Handle responses to pending requests (responses have no method)
+                    else:
+                        future = self._pending_requests.get(data.get("id"))
+                        if future and not future.done():
+                            future.set_result(data)
                     
-                except json.JSONDecodeError as e:
+                except json.JSONDecodeError as e:  # Also raised by orjson
                     logger.warning(f"Failed to parse message: {e}")
                 except Exception as e:
                     logger.error(f"Error processing message: {e}")
@@ -227,38 +367,23 @@ class MoonrakerClient:
         except websockets.exceptions.ConnectionClosed:
             logger.warning("WebSocket connection closed")
             self.connected = False
-            # Cancel all pending requests
-            for future in self._pending_requests.values():
-                if not future.done():
-                    future.cancel()
-            self._pending_requests.clear()
             raise
         except Exception as e:
             logger.error(f"Error in listen loop: {e}")
             self.connected = False
             raise
+        finally:
+            # No responses can arrive once the loop stops; cancel all pending requests
+            for future in self._pending_requests.values():
+                if not future.done():
+                    future.cancel()
+            self._pending_requests.clear()
     
     async def disconnect(self):
         """Disconnect from Moonraker WebSocket."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
         if self.websocket:
             await self.websocket.close()
             self.connected = False
             logger.info("Disconnected from Moonraker")
-    
-    async def reconnect(self):
-        """Reconnect to Moonraker with exponential backoff."""
-        while True:
-            try:
-                await self.connect()
-                return
-            except Exception as e:
-                logger.warning(
-                    f"Reconnection attempt failed: {e}. "
-                    f"Retrying in {self._reconnect_delay} seconds..."
-                )
-                await asyncio.sleep(self._reconnect_delay)
-                self._reconnect_delay = min(
-                    self._reconnect_delay * 2,
-                    self._max_reconnect_delay
-                )
-